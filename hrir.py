@@ -4,7 +4,8 @@ import os
 import warnings
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import signal, fftpack
+from scipy import signal
+from scipy.fft import next_fast_len
 from PIL import Image
 from autoeq.frequency_response import FrequencyResponse
 from impulse_response import ImpulseResponse
@@ -44,7 +45,8 @@ class HRIR:
             raise ValueError('Refusing to open recording because HRIR\'s sampling rate doesn\'t match impulse response '
                              'estimator\'s sampling rate.')
 
-        fs, recording = read_wav(file_path, expand=True)
+        # Single precision halves the memory traffic of the estimation and is plenty for 24 bit recordings
+        fs, recording = read_wav(file_path, expand=True, dtype='float32')
         if fs != self.fs:
             raise ValueError('Sampling rate of recording must match sampling rate of test signal.')
 
@@ -62,42 +64,37 @@ class HRIR:
         recording = recording[:, silence_length:]
 
         # Split sections in time to columns
-        columns = []
         column_size = silence_length + len(self.estimator)
-        for i in range(n_columns):
-            columns.append(recording[:, i * column_size:(i + 1) * column_size])
-
-        # Split each track by columns
-        i = 0
-        while i < recording.shape[0]:
-            for j, column in enumerate(columns):
-                n = int(i // 2 * len(columns) + j)
-                speaker = speakers[n]
-                if speaker not in SPEAKER_NAMES:
-                    # Skip non-standard speakers. Useful for skipping the other sweep in center channel recording.
-                    continue
-                if speaker not in self.irs:
-                    self.irs[speaker] = dict()
-                if side is None:
-                    # Left first, right then
-                    self.irs[speaker]['left'] = ImpulseResponse(
-                        self.estimator.estimate(column[i, :]),
-                        self.fs,
-                        column[i, :]
-                    )
-                    self.irs[speaker]['right'] = ImpulseResponse(
-                        self.estimator.estimate(column[i + 1, :]),
-                        self.fs,
-                        column[i + 1, :]
-                    )
-                else:
-                    # Only the given side
-                    self.irs[speaker][side] = ImpulseResponse(
-                        self.estimator.estimate(column[i, :]),
-                        self.fs,
-                        column[i, :]
-                    )
-            i += tracks_k
+        n_samples = n_columns * column_size
+        if recording.shape[1] < n_samples:
+            # Recording ends before the last column is complete, fill with silence
+            recording = np.pad(recording, ((0, 0), (0, n_samples - recording.shape[1])))
+        # Columns as a view with one row per track and one column per sweep, data is not copied
+        columns = np.reshape(recording[:, :n_samples], (recording.shape[0], n_columns, column_size))
+
+        # Estimate impulse responses for all tracks and columns in one batch
+        estimates = self.estimator.estimate(columns)
+
+        # Group tracks by speaker sequence, a group has both ears or only the given side
+        # Speaker n in the sequence is then in group n // n_columns and column n % n_columns
+        n_groups = recording.shape[0] // tracks_k
+        columns = np.reshape(columns, (n_groups, tracks_k, n_columns, column_size))
+        estimates = np.reshape(estimates, (n_groups, tracks_k, n_columns, column_size))
+        sides = ['left', 'right'] if side is None else [side]
+        for n, speaker in enumerate(speakers[:n_groups * n_columns]):
+            if speaker not in SPEAKER_NAMES:
+                # Skip non-standard speakers. Useful for skipping the other sweep in center channel recording.
+                continue
+            if speaker not in self.irs:
+                self.irs[speaker] = dict()
+            group, column = divmod(n, n_columns)
+            # Left first, right then
+            for k, _side in enumerate(sides):
+                self.irs[speaker][_side] = ImpulseResponse(
+                    estimates[group, k, column, :],
+                    self.fs,
+                    columns[group, k, column, :]
+                )
 
     def write_wav(self, file_path, track_order=None, bit_depth=32):
         """Writes impulse responses to a WAV file
@@ -114,23 +111,16 @@ class HRIR:
         if track_order is None:
             track_order = HEXADECAGONAL_TRACK_ORDER
 
-        # Add all impulse responses to a list and save channel names
-        irs = []
-        ir_order = []
+        # Allocate all tracks as silent and copy impulse responses directly to their columns in the output order.
+        # Samples are on rows which is the interleaved frame layout of WAV files so the writer doesn't need to
+        # transpose and copy the data
+        n = max(len(ir) for pair in self.irs.values() for ir in pair.values())
+        irs = np.zeros((n, len(track_order)))
         for speaker, pair in self.irs.items():
             for side, ir in pair.items():
-                irs.append(ir.data)
-                ir_order.append(f'{speaker}-{side}')
-
-        # Add silent tracks
-        for ch in track_order:
-            if ch not in ir_order:
-                irs.append(np.zeros(len(irs[0])))
-                ir_order.append(ch)
-        irs = np.vstack(irs)
-
-        # Sort to output order
-        irs = irs[[ir_order.index(ch) for ch in track_order], :]
+                ch = f'{speaker}-{side}'
+                if ch in track_order:
+                    irs[:len(ir), track_order.index(ch)] = ir.data
 
         # Write to file
         write_wav(file_path, self.fs, irs, bit_depth=bit_depth)
@@ -253,7 +243,7 @@ class HRIR:
         seconds_per_octave = len(self.estimator) / self.estimator.fs / self.estimator.n_octaves
         fade_out = 2 * int(self.fs * seconds_per_octave * (1 / 24))  # Duration of 1/24 octave in the sweep
         window = signal.hanning(fade_out)[fade_out // 2:]
-        fft_len = fftpack.next_fast_len(max(tail_indices))
+        fft_len = next_fast_len(max(tail_indices), real=True)
         tail_ind = min(np.min(lengths), fft_len)
         for speaker, pair in self.irs.items():
             for ir in pair.values():
@@ -7,7 +7,7 @@ from matplotlib.mlab import specgram
 from matplotlib.ticker import LinearLocator, FormatStrFormatter, FuncFormatter
 from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 unused import
 from mpl_toolkits.axes_grid1 import make_axes_locatable
-from scipy import signal, stats, ndimage, interpolate
+from scipy import signal, stats, ndimage
 import nnresample
 from copy import deepcopy
 from autoeq.frequency_response import FrequencyResponse
@@ -45,23 +45,35 @@ class ImpulseResponse:
         """
         if end is None:
             end = len(self.data)
-        # Peak height threshold, relative to the data maximum value
-        # Copy to avoid manipulating the original data here
-        data = self.data.copy()
         # Limit search to given range
-        data = data[start:end]
-        # Normalize to 1.0
-        data /= np.max(np.abs(data))
-        # Find positive peaks
-        peaks_pos, properties = signal.find_peaks(data, height=peak_height)
-        # Find negative peaks that are at least
-        peaks_neg, _ = signal.find_peaks(data * -1.0, height=peak_height)
-        # Combine positive and negative peaks
-        peaks = np.concatenate([peaks_pos, peaks_neg])
-        # Add start delta to peak indices
-        peaks += start
-        # Return the first one
-        return np.min(peaks)
+        data = self.data[start:end]
+        # Peak height threshold, relative to the data maximum value
+        # Threshold is scaled instead of normalizing the data so the data is neither copied nor scanned again
+        magnitude = np.abs(data)
+        threshold = peak_height * np.max(magnitude)
+        # Every peak high enough lies in a lobe of samples exceeding the threshold so the lobes are searched in order
+        # and only the first lobe containing a peak is passed to the peak finder
+        over = magnitude >= threshold
+        i = np.argmax(over)
+        while over[i]:
+            sign = np.sign(data[i])
+            # Lobe ends at the first sample which doesn't exceed the threshold in the lobe's direction
+            below = sign * data[i:] < threshold
+            lobe_end = i + np.argmax(below)
+            if lobe_end == i:
+                # Lobe continues until the end of data
+                lobe_end = len(data)
+            # Include the lower neighbour samples on both sides so that peaks are detected as in the full data
+            lobe_start = max(i - 1, 0)
+            peaks, _ = signal.find_peaks(sign * data[lobe_start:lobe_end + 1], height=threshold)
+            if len(peaks):
+                # Add start delta to peak index
+                return start + lobe_start + peaks[0]
+            if lobe_end == len(data):
+                break
+            # Move on to the next lobe
+            i = lobe_end + np.argmax(over[lobe_end:])
+        raise ValueError('No peaks found in the impulse response.')
 
     def decay_params(self):
         """Determines decay parameters with Lundeby method
@@ -79,18 +91,16 @@ class ImpulseResponse:
 
         # 1. The squared impulse response is averaged into localtime intervals in the range of 10–50 ms,
         # to yield a smooth curve without losing short decays.
-        data = self.data.copy()
         # From peak to 2 seconds after the peak
-        data = data[peak_index:min(peak_index + 2 * self.fs, len(self))]
-        data /= np.max(np.abs(data))  # Normalize
+        data = self.data[peak_index:min(peak_index + 2 * self.fs, len(self))]
+        data = data / np.max(np.abs(data))  # Normalize, only the selected range gets copied
         squared = data ** 2  # Squared impulse response starting from the peak
         t_squared = np.linspace(0, len(squared) / self.fs, len(squared))  # Time stamps starting from peak
         wd = 0.03  # Window duration, let's start with 30 ms
         n = int(len(squared) / self.fs / wd)  # Number of time windows
         w = int(len(squared) / n)  # Width of a single time window
         t_windows = np.arange(n) * wd + wd / 2  # Timestamps for the window centers
-        windows = squared.copy()  # Copy to avoid modifying the original
-        windows = np.reshape(windows[:n * w], (n, w))  # Split into time windows, one window per row
+        windows = np.reshape(squared[:n * w], (n, w))  # Split into time windows, one window per row
         windows = np.mean(windows, axis=1)  # Average each time window
         windows = 10 * np.log10(windows)  # dB
 
@@ -122,13 +132,14 @@ class ImpulseResponse:
         t_windows = np.arange(n) * wd + wd / 2  # Time window center time stamps
 
         # 6. The squared impulse is averaged into the new local time intervals.
-        windows = squared.copy()
-        windows = np.reshape(windows[:n * w], (n, w))  # Split into time windows
+        windows = np.reshape(squared[:n * w], (n, w))  # Split into time windows
         windows = np.mean(windows, axis=1)  # Average each time window
         windows = 10 * np.log10(windows)  # dB
 
+        # Time stamps are sorted so the first window at or after the knee point is found with a binary search.
+        # Knee point past the last window gives out of bounds index
         try:
-            knee_point_index = np.argwhere(t_windows >= knee_point_time)[0, 0]
+            knee_point_index = np.searchsorted(t_windows, knee_point_time, side='left')
             knee_point_value = windows[knee_point_index]
         except IndexError as err:
             # Probably tail has already been cropped
@@ -153,10 +164,10 @@ class ImpulseResponse:
             # noise_floor_end_time = noise_floor_start_time + 0.1 * len(squared) / ir.fs  # TODO: Until the very end?
             # Noise floor estimation range ends one full decay time after the start, truncated to the IR length
             noise_floor_end_time = min(noise_floor_start_time + knee_point_time, self.duration())
-            noise_floor = np.mean(squared[np.logical_and(
-                t_squared >= noise_floor_start_time,
-                t_squared <= noise_floor_end_time
-            )])
+            # Time stamps are sorted so the noise floor segment can be sliced out with a binary search
+            noise_floor_start = np.searchsorted(t_squared, noise_floor_start_time, side='left')
+            noise_floor_end = np.searchsorted(t_squared, noise_floor_end_time, side='right')
+            noise_floor = np.mean(squared[noise_floor_start:noise_floor_end])
             noise_floor = 10 * np.log10(noise_floor)  # dB
             # print(f'      Noise floor '
             #       f'({(noise_floor_start_time + peak_index / self.fs) * 1000:.0f} ms -> '
@@ -184,11 +195,11 @@ class ImpulseResponse:
             if knee_point_time > t_windows[-1]:
                 knee_point_time = t_windows[-1]
                 break
-            knee_point_index = np.argwhere(t_windows >= knee_point_time)[0, 0]
+            knee_point_index = np.searchsorted(t_windows, knee_point_time, side='left')
             knee_point_value = windows[knee_point_index]
             # print(f'      Knee point: {knee_point_value:.2f} dB @ {knee_point_time * 1000:.0f} ms')
             # Index of first window which comes after slope end time
-            new_knee_point_index = np.argwhere(t_windows >= knee_point_time)[0, 0]
+            new_knee_point_index = np.searchsorted(t_windows, knee_point_time, side='left')
             if new_knee_point_index == knee_point_index:
                 # Converged
                 knee_point_index = new_knee_point_index
@@ -199,7 +210,7 @@ class ImpulseResponse:
         # Until this point knee_point_index has been an index to windows,
         # find the index to impulse response data
         knee_point_time = t_windows[knee_point_index]
-        knee_point_index = np.argwhere(t_squared >= knee_point_time)[0, 0]
+        knee_point_index = np.searchsorted(t_squared, knee_point_time, side='left')
 
         return peak_index, peak_index + knee_point_index, noise_floor, w
 
@@ -225,26 +236,27 @@ class ImpulseResponse:
         t = np.linspace(0, self.duration(), len(self))
 
         knee_point_ind -= (peak_ind + 0)
-        data = self.data.copy()
-        data = data[peak_ind - 0 * self.fs // 1000:]
-        data /= np.max(np.abs(data))
+        data = self.data[peak_ind - 0 * self.fs // 1000:]
+        data = data / np.max(np.abs(data))
         # analytical = np.abs(signal.hilbert(data))  # Hilbert doesn't work will with broadband signa
         analytical = np.abs(data)
 
-        schroeder = np.cumsum(analytical[knee_point_ind::-1] ** 2 / np.sum(analytical[:knee_point_ind] ** 2))[:0:-1]
+        schroeder = np.cumsum(
+            analytical[knee_point_ind::-1] ** 2 / np.sum(analytical[:knee_point_ind] ** 2),
+            dtype=np.float64  # Backward integral in double precision, single precision sums lose the late decay
+        )[:0:-1]
         schroeder = 10 * np.log10(schroeder)
 
         # Moving average of the squared impulse response
-        avg = self.data.copy()
         # Truncate data to avoid unnecessary computations
         # Ideally avg_head is the half window size but this might not be possible if the IR has been truncated already
         # and the peak is closer to the start than half window
         avg_head = min((window_size // 2), peak_ind)
-        avg_tail = min((window_size // 2), len(avg) - (peak_ind + knee_point_ind))
+        avg_tail = min((window_size // 2), len(self) - (peak_ind + knee_point_ind))
         # We need an index offset for average curve if the avg_head is not half window
         avg_offset = window_size // 2 - avg_head
-        avg = avg[peak_ind - avg_head:peak_ind + knee_point_ind + avg_tail]  # Truncate
-        avg /= np.max(np.abs(avg))  # Normalize
+        avg = self.data[peak_ind - avg_head:peak_ind + knee_point_ind + avg_tail]  # Truncate
+        avg = avg / np.max(np.abs(avg))  # Normalize
         avg = avg ** 2
         avg = running_mean(avg, window_size)
         avg = 10 * np.log10(avg + 1e-18)
@@ -258,6 +270,8 @@ class ImpulseResponse:
             avg[fit_start - avg_offset:fit_end - avg_offset]  # Shift avg indexes by the offset length
         )
 
+        # Schroeder curve decreases monotonically, negated it's sorted for binary searches of the target levels
+        schroeder_negated = -schroeder
         decay_times = dict()
         limits = [(-1, -10, -10, 'EDT'), (-5, -25, -20, 'RT20'), (-5, -35, -30, 'RT30'), (-5, -65, -60, 'RT60')]
         for start_target, end_target, decay_target, name in limits:
@@ -266,10 +280,9 @@ class ImpulseResponse:
                 # There has to be at least 10 dB of headroom between the end target point and noise floor,
                 # in this case there is not. Current decay time shall remain undefined.
                 continue
-            try:
-                start = np.argwhere(schroeder <= start_target)[0, 0]
-                end = np.argwhere(schroeder <= end_target)[0, 0]
-            except IndexError as err:
+            start = np.searchsorted(schroeder_negated, -start_target, side='left')
+            end = np.searchsorted(schroeder_negated, -end_target, side='left')
+            if end == len(schroeder):
                 # Targets not found on the Schroeder curve
                 continue
             slope, intercept, _, _, _ = stats.linregress(t[start:end], schroeder[start:end])
@@ -317,8 +330,8 @@ class ImpulseResponse:
         Returns:
             None
         """
-        peak_index, knee_point_index, _, _ = self.decay_params()
-        edt, rt20, rt30, rt60 = self.decay_times()
+        peak_index, knee_point_index, noise_floor, window_size = self.decay_params()
+        edt, rt20, rt30, rt60 = self.decay_times(peak_index, knee_point_index, noise_floor, window_size)
         rt_slope = None
         # Finds largest available decay time parameter
         for rt_time, rt_level in [(edt, -10), (rt20, -20), (rt30, -30), (rt60, -60)]:
@@ -393,6 +406,9 @@ class ImpulseResponse:
                 ax.append(fig.add_subplot(2, 3, i + 1))
             ax.append(fig.add_subplot(2, 3, 6, projection='3d'))
             ax = np.vstack([ax[:3], ax[3:]])
+        if plot_decay or plot_waterfall:
+            # Decay parameters are shared by decay and waterfall plots
+            peak_ind, knee_point_ind, noise_floor, window_size = self.decay_params()
         if plot_recording:
             self.plot_recording(fig=fig, ax=ax[0, 0])
         if plot_spectrogram:
@@ -402,9 +418,15 @@ class ImpulseResponse:
         if plot_fr:
             self.plot_fr(fig=fig, ax=ax[1, 1])
         if plot_decay:
-            self.plot_decay(fig=fig, ax=ax[0, 2])
+            self.plot_decay(
+                fig=fig, ax=ax[0, 2],
+                peak_ind=peak_ind, knee_point_ind=knee_point_ind, noise_floor=noise_floor, window_size=window_size
+            )
         if plot_waterfall:
-            self.plot_waterfall(fig=fig, ax=ax[1, 2])
+            self.plot_waterfall(
+                fig=fig, ax=ax[1, 2],
+                peak_ind=peak_ind, knee_point_ind=knee_point_ind, noise_floor=noise_floor, window_size=window_size
+            )
         if plot_file_path:
             fig.savefig(plot_file_path)
         return fig
@@ -632,13 +654,18 @@ class ImpulseResponse:
 
         return fig, ax
 
-    def plot_decay(self, fig=None, ax=None, plot_file_path=None):
+    def plot_decay(self, fig=None, ax=None, plot_file_path=None,
+                   peak_ind=None, knee_point_ind=None, noise_floor=None, window_size=None):
         """Plots decay graph.
 
         Args:
             fig: Figure instance. New will be created if None is passed.
             ax: Axis instance. New will be created if None is passed to fig.
             plot_file_path: Save plot figure to a file.
+            peak_ind: Peak index as returned by `decay_params()`. Optional.
+            knee_point_ind: Knee point index as returned by `decay_params()`. Optional.
+            noise_floor: Noise floor as returned by `decay_params()`. Optional.
+            window_size: Moving average window size as returned by `decay_params()`. Optional.
 
         Returns:
             - Figure
@@ -647,15 +674,14 @@ class ImpulseResponse:
         if fig is None:
             fig, ax = plt.subplots()
 
-        peak_ind, knee_point_ind, noise_floor, window_size = self.decay_params()
+        if peak_ind is None or knee_point_ind is None or noise_floor is None or window_size is None:
+            peak_ind, knee_point_ind, noise_floor, window_size = self.decay_params()
 
         start = max(0, (peak_ind - 2 * (knee_point_ind - peak_ind)))
         end = min(len(self), (peak_ind + 2 * (knee_point_ind - peak_ind)))
         t = np.arange(start, end) / self.fs
 
-        squared = self.data.copy()
-        squared /= np.max(np.abs(squared))
-        squared = squared[start:end] ** 2
+        squared = (self.data[start:end] / np.max(np.abs(self.data))) ** 2
         avg = running_mean(squared, window_size)
         squared = 10 * np.log10(squared + 1e-24)
         avg = 10 * np.log10(avg + 1e-24)
@@ -682,8 +708,21 @@ class ImpulseResponse:
 
         return fig, ax
 
-    def plot_waterfall(self, fig=None, ax=None):
-        """"""
+    def plot_waterfall(self, fig=None, ax=None, peak_ind=None, knee_point_ind=None, noise_floor=None, window_size=None):
+        """Plots waterfall graph.
+
+        Args:
+            fig: Figure instance. New will be created if None is passed.
+            ax: Axis instance with 3D projection. New will be created if None is passed to fig.
+            peak_ind: Peak index as returned by `decay_params()`. Optional.
+            knee_point_ind: Knee point index as returned by `decay_params()`. Optional.
+            noise_floor: Noise floor as returned by `decay_params()`. Optional.
+            window_size: Moving average window size as returned by `decay_params()`. Optional.
+
+        Returns:
+            - Figure
+            - Axes
+        """
         if fig is None:
             fig, ax = plt.subplots()
 
@@ -704,10 +743,11 @@ class ImpulseResponse:
         ])
 
         # Crop from 10ms before peak to start of tail
-        peak_ind, tail_ind, noise_floor, _ = self.decay_params()
+        if peak_ind is None or knee_point_ind is None:
+            peak_ind, knee_point_ind, noise_floor, window_size = self.decay_params()
         start = max(int(peak_ind - self.fs * 0.01), 0)
         # Stop index is greater of 1s after peak or 1 FFT window after tail
-        stop = min(int(round(max(peak_ind + self.fs * 1, tail_ind + nfft))), len(self.data))
+        stop = min(int(round(max(peak_ind + self.fs * 1, knee_point_ind + nfft))), len(self.data))
         data = self.data[start:stop]
 
         # Get spectrogram data
@@ -721,13 +761,15 @@ class ImpulseResponse:
         f_max = self.fs / 2
         f_min = 10
         step = 1.03
-        f = np.array([f_min * step ** i for i in range(int(np.log(f_max / f_min) / np.log(step)))])
-        log_f_spec = np.ones((len(f), spectrum.shape[1]))
-        for i in range(spectrum.shape[1]):
-            interpolator = interpolate.InterpolatedUnivariateSpline(np.log10(freqs), spectrum[:, i], k=1)
-            log_f_spec[:, i] = interpolator(np.log10(f))
-        z = log_f_spec
+        f = f_min * step ** np.arange(int(np.log(f_max / f_min) / np.log(step)))
+        # Linear interpolation on log frequency axis is the same for every time segment so the neighbour indices and
+        # weights are computed only once and applied to all segments at the same time. Edge segments are extended
+        # for the frequencies outside of the spectrogram frequencies
+        log_freqs = np.log10(freqs)
         f = np.log10(f)
+        i = np.clip(np.searchsorted(log_freqs, f) - 1, 0, len(log_freqs) - 2)
+        w = ((f - log_freqs[i]) / (log_freqs[i + 1] - log_freqs[i]))[:, np.newaxis]
+        z = spectrum[i, :] * (1 - w) + spectrum[i + 1, :] * w
 
         # Normalize and turn to dB scale
         z /= np.max(z)
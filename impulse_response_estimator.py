@@ -3,8 +3,7 @@
 import os
 from argparse import ArgumentParser
 import pickle
-from scipy.fftpack import fft
-from scipy.signal import convolve
+from scipy.fft import rfft, irfft, next_fast_len
 from scipy.signal.windows import hann
 import numpy as np
 import matplotlib.pyplot as plt
@@ -40,10 +39,22 @@ class ImpulseResponseEstimator(object):
 
         # Generate inverse filter
         self.inverse_filter = self.generate_inverse_filter()
+        # Inverse filter spectra by FFT length and data type
+        self._inverse_filter_spectra = dict()
 
     def __len__(self):
         return len(self.test_signal)
 
+    def __getstate__(self):
+        # Cached spectra are not pickled, they are cheap to re-create and would bloat the file
+        state = self.__dict__.copy()
+        state.pop('_inverse_filter_spectra', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._inverse_filter_spectra = dict()
+
     def plot(self):
         f, m = magnitude_response(self.test_signal, self.fs)
         plt.plot(f, m)
@@ -70,12 +81,20 @@ class ImpulseResponseEstimator(object):
         """
         P = self.n_octaves
         N = len(self.test_signal)
-        inverse_filter = np.flip(self.test_signal) * (2**(P / N))**(np.arange(N)*-1) * P * np.log(2) / (1 - 2**-P)
+        # Amplitude envelope decays by P octaves over the filter, exponent is evaluated directly instead of raising
+        # the rounded per sample ratio 2^(P/N) to large powers, which accumulates the rounding error
+        envelope = np.exp2(-P * np.arange(N) / N)
+        inverse_filter = np.flip(self.test_signal) * envelope * P * np.log(2) / (1 - 2**-P)
 
         # Now we have to normalize energy of result of dot product.
         # This is "naive" method but it just works.
-        frp = fft(convolve(inverse_filter, self.test_signal, method='auto'))
-        inverse_filter /= np.abs(frp[round(frp.shape[0]/4)])
+        # Only a single frequency bin (quarter of the sampling rate) of the full convolution's spectrum is needed and
+        # that is the product of the two signals' spectra at the same bin. Evaluating the bin directly avoids
+        # convolving and transforming 2N-1 samples.
+        nfft = 2 * N - 1
+        k = round(nfft / 4)
+        twiddle = np.exp(-2j * np.pi * k * np.arange(N) / nfft)
+        inverse_filter /= np.abs(np.dot(inverse_filter, twiddle) * np.dot(self.test_signal, twiddle))
 
         return inverse_filter
 
@@ -145,9 +164,49 @@ class ImpulseResponseEstimator(object):
 
         return test_signal
 
+    def inverse_filter_spectrum(self, nfft, dtype=np.float64):
+        """Calculates real FFT of the inverse filter zero padded to the given length.
+
+        Spectrum is computed only once for each FFT length and shared by all the recordings estimated after that.
+
+        Args:
+            nfft: FFT length
+            dtype: Real data type of the recordings, single precision spectrum is used for single precision recordings
+
+        Returns:
+            Inverse filter spectrum as Numpy array
+        """
+        key = (nfft, np.dtype(dtype))
+        if key not in self._inverse_filter_spectra:
+            self._inverse_filter_spectra[key] = rfft(self.inverse_filter.astype(dtype), n=nfft)
+        return self._inverse_filter_spectra[key]
+
     def estimate(self, recording):
-        """Estimates impulse response"""
-        return convolve(recording, self.inverse_filter, mode='same', method='auto')
+        """Estimates impulse response
+
+        Recording is convolved with the inverse filter in frequency domain. FFT length is padded to the next fast
+        length so that real valued FFTs never fall back to the slow paths for awkward lengths. Multiple tracks are
+        transformed in a single batch and share the same inverse filter spectrum, which is also reused between calls.
+        Transforms keep the precision of the recording so single precision recordings produce single precision
+        impulse responses with half the memory traffic.
+
+        Args:
+            recording: Recording of the test signal as Numpy array. Either a single track or multiple tracks with one
+                       row per track.
+
+        Returns:
+            Impulse response(s) with the same shape as the recording
+        """
+        n = recording.shape[-1] + len(self.inverse_filter) - 1
+        nfft = next_fast_len(n, real=True)
+        # Batched transforms are split across all CPU cores
+        ir = irfft(
+            rfft(recording, n=nfft, axis=-1, workers=-1) * self.inverse_filter_spectrum(nfft, dtype=recording.dtype),
+            n=nfft, axis=-1, workers=-1
+        )
+        # Center part of the full convolution, same as "same" mode of convolution
+        start = (len(self.inverse_filter) - 1) // 2
+        return ir[..., start:start + recording.shape[-1]]
 
     def sweep_sequence(self, speakers, tracks):
         """Creates sine sweep sequence data with multiple tracks
@@ -203,7 +203,7 @@ def open_generic_room_measurement(estimator,
         return None
 
     # Read the file
-    fs, data = read_wav(file_path, expand=True)
+    fs, data = read_wav(file_path, expand=True, dtype='float32')
 
     if fs != estimator.fs:
         raise ValueError(f'Sampling rate of "{file_path}" doesn\'t match!')
@@ -3,17 +3,18 @@
 import os
 import numpy as np
 import soundfile as sf
-from scipy.fftpack import fft
+from scipy.fft import rfft, rfftfreq, next_fast_len
 from PIL import Image
 import matplotlib.ticker as ticker
 
 
-def read_wav(file_path, expand=False):
+def read_wav(file_path, expand=False, dtype='float64'):
     """Reads WAV file
 
     Args:
         file_path: Path to WAV file as string
         expand: Expand dimensions of a single track recording to produce 2-D array?
+        dtype: Data type of the returned samples, "float64" or "float32"
 
     Returns:
         - sampling frequency as integer
@@ -21,7 +22,7 @@ def read_wav(file_path, expand=False):
     """
     if not os.path.isfile(file_path):
         raise FileNotFoundError(f'File in path "{os.path.abspath(file_path)}" does not exist.')
-    data, fs = sf.read(file_path)
+    data, fs = sf.read(file_path, dtype=dtype)
     if len(data.shape) > 1:
         # Soundfile has tracks on columns, we want them on rows
         data = np.transpose(data)
@@ -32,14 +33,10 @@ def read_wav(file_path, expand=False):
 
 def write_wav(file_path, fs, data, bit_depth=32):
     """Writes WAV file."""
-    if bit_depth == 16:
-        subtype = "PCM_16"
-    elif bit_depth == 24:
-        subtype = "PCM_24"
-    elif bit_depth == 32:
-        subtype = "PCM_32"
-    else:
+    subtypes = {16: 'PCM_16', 24: 'PCM_24', 32: 'PCM_32'}
+    if bit_depth not in subtypes:
         raise ValueError('Invalid bit depth. Accepted values are 16, 24 and 32.')
+    subtype = subtypes[bit_depth]
     if len(data.shape) > 1 and data.shape[1] > data.shape[0]:
         # We have tracks on rows, soundfile want's them on columns
         data = np.transpose(data)
@@ -57,11 +54,11 @@ def magnitude_response(x, fs):
         - **f:** Frequencies
         - **X:** Magnitudes
     """
-    _x = x
-    nfft = len(_x)
-    df = fs / nfft
-    f = np.arange(0, fs - df, df)
-    X = fft(_x)
+    # Zero pad to the next fast FFT length, arbitrary lengths can be several times slower to transform
+    nfft = next_fast_len(len(x), real=True)
+    # Real input has symmetric spectrum, only the non-negative frequencies are computed
+    f = rfftfreq(nfft, 1 / fs)
+    X = rfft(x, n=nfft)
     X_mag = 20 * np.log10(np.abs(X))
     return f[0:int(np.ceil(nfft/2))], X_mag[0:int(np.ceil(nfft/2))]
 
@@ -187,5 +184,6 @@ def config_fr_axis(ax):
 
 
 def running_mean(x, N):
-    cumsum = np.cumsum(np.insert(x, 0, 0))
+    # Accumulate in double precision, single precision sums lose the low level tail in the differences
+    cumsum = np.cumsum(np.insert(x, 0, 0), dtype=np.float64)
     return (cumsum[N:] - cumsum[:-N]) / float(N)